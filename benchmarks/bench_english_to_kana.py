@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import jsay  # noqa: E402
+
+WORDS = [
+    'ERROR',
+    'connection',
+    'timeout',
+    'server',
+    'request',
+    'failed',
+    'retry',
+    'GitHub',
+    'Actions',
+    'deploy',
+    'database',
+]
+JAPANESE = ['接続に失敗しました', '再試行します', '。', '、', ': ', '\n', '　']
+
+
+def convert_english_to_kana_legacy(text, english_word_min_length):
+    output = ''
+    while word := re.search(r'[a-zA-Z]{' f'{english_word_min_length}' r',} ?', text):
+        converted = jsay.word_to_kana(word.group().rstrip(), english_word_min_length)
+        if word.group() == f'{converted} ':
+            converted += ' '
+
+        output += text[: word.start()] + converted
+        text = text[word.end() :]
+
+    return output + text
+
+
+def make_log(size):
+    rng = random.Random(size)
+    pieces = []
+    length = 0
+    while length < size:
+        piece = rng.choice(WORDS) + ' ' + rng.choice(JAPANESE)
+        pieces.append(piece)
+        length += len(piece)
+    return ''.join(pieces)
+
+
+def measure(func, text):
+    # both implementations start with a cold word_to_kana cache
+    jsay.__kana_cache.clear()
+    start = time.perf_counter()
+    result = func(text, 3)
+    return result, time.perf_counter() - start
+
+
+def main():
+    # measure the scanner itself rather than kanalizer inference
+    jsay.settings.use_kanalizer = False
+    # loading the dictionaries is not part of either conversion
+    jsay.convert_english_to_kana(make_log(100), 3)
+    print(f'{"chars":>8} {"legacy [s]":>11} {"current [s]":>12}')
+    for size in [1000, 10000, 100000, 300000]:
+        text = make_log(size)
+        expected, legacy = measure(convert_english_to_kana_legacy, text)
+        result, current = measure(jsay.convert_english_to_kana, text)
+        assert result == expected
+        print(f'{size:>8} {legacy:>11.3f} {current:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+MAIN_DIR = Path(__file__).resolve().parent.parent
+NUM_RUNS = 5
+NUM_TOP_MODULES = 5
+
+# cumulative import time budgets in milliseconds, measured with -X importtime
+BUDGETS = {
+    'jsay': 200,
+    'vsay': 200,
+    'jserver': 600,
+    'vserver': 600,
+}
+
+# modules which must be imported only by the pipeline stage that needs them
+LAZY_MODULES = ['alkana', 'kanalizer', 'soundcard', 'soundfile', 'voicevox_core']
+
+
+def import_times(module):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=MAIN_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times.setdefault(name.strip(), int(cumulative) / 1000)
+    return times
+
+
+def main():
+    failed = False
+    print(f'{"module":>8} {"budget":>8} {"median":>8}  top imports [ms]')
+    for module, budget in BUDGETS.items():
+        runs = [import_times(module) for _ in range(NUM_RUNS)]
+        median = statistics.median(run[module] for run in runs)
+        last = runs[-1]
+        top = sorted(
+            (name for name in last if name not in (module, 'site') and '.' not in name),
+            key=last.get,
+            reverse=True,
+        )[:NUM_TOP_MODULES]
+        print(
+            f'{module:>8} {budget:>8} {median:>8.1f}  '
+            + ', '.join(f'{name}={last[name]:.1f}' for name in top)
+        )
+        if median > budget:
+            print(f'  over budget: {module}')
+            failed = True
+        if eager := [name for name in LAZY_MODULES if name in last]:
+            print(f'  imported eagerly: {", ".join(eager)}')
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jsay import KeywordMatcher  # noqa: E402
+
+TEXT_LENGTH = 20000
+
+
+def make_keys(n):
+    rng = random.Random(n)
+    keys = set()
+    while len(keys) < n:
+        length = rng.randint(3, 12)
+        keys.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+    return list(keys)
+
+
+def make_text(keys):
+    rng = random.Random(0)
+    words = []
+    length = 0
+    while length < TEXT_LENGTH:
+        if rng.random() < 0.2:
+            word = rng.choice(keys).upper()
+        else:
+            word = 'テキスト' + rng.choice(string.ascii_letters)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def measure(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f'{"entries":>8} {"impl":>8} {"build [s]":>10} {"apply [s]":>10}')
+    for n in [1000, 10000, 100000]:
+        keys = make_keys(n)
+        text = make_text(keys)
+        user_dic = {k: f'<{k}>' for k in keys}
+
+        regex, build = measure(
+            lambda: re.compile('|'.join(re.escape(k) for k in keys), re.IGNORECASE)
+        )
+        _, apply = measure(
+            lambda: regex.sub(lambda m: user_dic[m.group(0).lower()], text)
+        )
+        print(f'{n:>8} {"regex":>8} {build:>10.3f} {apply:>10.3f}')
+
+        matcher, build = measure(lambda: KeywordMatcher(keys))
+        _, apply = measure(lambda: matcher.sub(lambda m: user_dic[m.lower()], text))
+        print(f'{n:>8} {"matcher":>8} {build:>10.3f} {apply:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,25 +12,35 @@
 # ///
 
 import argparse
+import array
+import atexit
+import collections
+import concurrent.futures
+import contextlib
 import csv
+import functools
+import hashlib
 import io
+import itertools
+import json
 import logging
+import math
+import mmap
 import os
 import platform
 import queue
 import re
+import shlex
+import struct
 import subprocess
 import sys
 import tempfile
 import threading
+import time
 import traceback
-import wave
 from pathlib import Path
 
-import alkana
 import fasteners
-import kanalizer
-import soundfile as sf
 from pydantic import BaseSettings
 
 # JDIC = '/var/lib/mecab/dic/open-jtalk/naist-jdic/'
@@ -41,6 +51,24 @@ APPIMAGE_DIR = Path(APPIMAGE_FILE).parent if APPIMAGE_FILE else None
 URL_REPLACE_TEXT = 'URL'
 URL_REGEX = re.compile(r'(https?|ftp)(:\/\/[-_.!~*\'()a-zA-Z0-9;\/?:\@&=+\$,%#]+)')
 SPLIT_TEXT_REGEX = re.compile(r'(?<=[\n　。、！？!?」』)）】》])|(?<=\.\s)')
+AUDIO_MEDIA_TYPES = {
+    'wav': 'audio/wav',
+    'pcm': 'audio/pcm',
+    'flac': 'audio/flac',
+    'opus': 'audio/ogg',
+    'mp3': 'audio/mpeg',
+    'aac': 'audio/aac',
+}
+SOUNDFILE_FORMATS = {
+    'flac': ('FLAC', 'PCM_16'),
+    'opus': ('OGG', 'OPUS'),
+    'mp3': ('MP3', 'MPEG_LAYER_III'),
+}
+OPUS_SAMPLING_RATES = (8000, 12000, 16000, 24000, 48000)
+FFMPEG_POOL_MAX_FORMATS = 4
+RESAMPLE_ZERO_CROSSINGS = 16
+RESAMPLE_KAISER_BETA = 8.6
+RESAMPLE_BLOCK_SIZE = 8192
 
 
 def _find_config_dir_path():
@@ -53,6 +81,16 @@ def _find_config_dir_path():
 CONFIG_DIR = _find_config_dir_path()
 
 
+def _find_cache_dir_path():
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+    if xdg_cache_home:
+        return Path(xdg_cache_home) / 'tts-server'
+    return Path.home() / '.cache' / 'tts-server'
+
+
+CACHE_DIR = _find_cache_dir_path()
+
+
 def _find_default_path(rel_path):
     if (Path('.').resolve() / rel_path).exists():
         return Path('.').resolve() / rel_path
@@ -78,13 +116,30 @@ class Settings(BaseSettings):
     english_dic: str = str(DEFAULT_ENGLISH_DIC)
     user_dic: str = str(DEFAULT_USER_DIC)
     lock_file: str = str(Path(tempfile.gettempdir()) / 'lockfiles/jsay.lock')
+    compiled_dic: str = str(CACHE_DIR / 'jsay_dic.bin')
+    audio_cache_dir: str = str(CACHE_DIR / 'jsay')
+    audio_cache_max_bytes: int = 64 * 1024 * 1024
+    audio_cache_disk_max_bytes: int = 512 * 1024 * 1024
+    audio_cache_ttl: int | None = None
+    phrase_cache_max_bytes: int = 32 * 1024 * 1024
     pulse_server: str | None = None
     play_command: str | list[str] = DEFAULT_PLAY_COMMAND
     play_timeout: int | None = 120
+    # e.g. 'pacat --format=s{bits}le --rate={rate} --channels={channels}'
+    play_stream_command: str | list[str] = ''
+    play_block_size: int = 4096
+    ffmpeg_command: str = 'ffmpeg'
+    ffmpeg_pool_size: int = 1
+    playback_buffer_size: int = 2
+    synthesis_workers: int = 1
     speaker_idx: int | None = None
     open_jtalk_timeout: int | None = 60
+    open_jtalk_pool_size: int = 1
+    open_jtalk_pool_max_params: int = 4
     batch_num_lines: int = 10
     batch_max_bytes: int = 1024
+    chunk_workers: int = 4
+    max_parallel_chunks: int = 1
     r: float = 1.0
     fm: float = 3.0
     english_word_min_length: int = 3
@@ -94,6 +149,11 @@ class Settings(BaseSettings):
     use_alkana: bool = True
     use_kanalizer: bool = True
     debug_kanalizer: bool = False
+    kana_cache_size: int = 4096
+    dic_watch_interval: float = 0
+    kanalizer_workers: int = 1
+    kanalizer_cache_size: int = 65536
+    kanalizer_cache_file: str = str(CACHE_DIR / 'kanalizer.jsonl')
 
     class Config:
         env_prefix = 'jsay_'
@@ -119,62 +179,730 @@ settings = Settings()
 if settings.pulse_server is not None and os.environ.get('PULSE_SERVER') is None:
     os.environ['PULSE_SERVER'] = settings.pulse_server
 
-ENGLISH_DIC = {}
-if settings.use_alkana:
-    ENGLISH_DIC.update(alkana.data.data)
-
-if Path(settings.english_dic).is_file():
-    with open(settings.english_dic, newline='', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        tmp_dict = {}
-        for r in reader:
-            if len(r) == 2 and (key := r[0].lower()) not in tmp_dict:
-                tmp_dict[key] = r[1]
-        ENGLISH_DIC.update(tmp_dict)
-        del reader, tmp_dict
-
-USER_DIC = {}
-USER_DATA_REGEX = None
-if Path(settings.user_dic).is_file():
-    with open(settings.user_dic, newline='', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        tmp_dict = {}
-        for r in reader:
-            if len(r) == 2 and (key := r[0].lower()) not in tmp_dict:
-                tmp_dict[key] = r[1]
-        USER_DIC.update(tmp_dict)
-        USER_DATA_REGEX = re.compile(
-            '|'.join(re.escape(k) for k in USER_DIC.keys()), re.IGNORECASE
+
+class KeywordMatcher:
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._length = [0]
+        self._output = [0]
+        for keyword in keywords:
+            if len(keyword) > 0:
+                self._add(keyword.lower())
+        self._build()
+
+    def _add(self, keyword):
+        node = 0
+        for c in keyword:
+            if (next_node := self._goto[node].get(c)) is None:
+                next_node = len(self._goto)
+                self._goto[node][c] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._length.append(0)
+                self._output.append(0)
+            node = next_node
+        self._length[node] = len(keyword)
+
+    def _build(self):
+        nodes = collections.deque(self._goto[0].values())
+        while len(nodes) > 0:
+            node = nodes.popleft()
+            fail = self._fail[node]
+            self._output[node] = node if self._length[node] > 0 else self._output[fail]
+            for c, child in self._goto[node].items():
+                state = fail
+                while state > 0 and c not in self._goto[state]:
+                    state = self._fail[state]
+                self._fail[child] = self._goto[state].get(c, 0)
+                nodes.append(child)
+
+    def find_all(self, text):
+        # leftmost-longest, non-overlapping
+        folded = text.lower()
+        if len(folded) != len(text):
+            folded = ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+        goto = self._goto
+        fail = self._fail
+        length = self._length
+        output = self._output
+        longest = {}
+        state = 0
+        for end, c in enumerate(folded, 1):
+            while state > 0 and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            node = output[state]
+            while node > 0:
+                start = end - length[node]
+                if length[node] > longest.get(start, 0):
+                    longest[start] = length[node]
+                node = output[fail[node]]
+
+        matches = []
+        pos = 0
+        for start in sorted(longest):
+            if start >= pos:
+                pos = start + longest[start]
+                matches.append((start, pos))
+        return matches
+
+    def sub(self, repl, text):
+        pieces = []
+        pos = 0
+        for start, end in self.find_all(text):
+            pieces.append(text[pos:start])
+            pieces.append(repl(text[start:end]))
+            pos = end
+        pieces.append(text[pos:])
+        return ''.join(pieces)
+
+
+class CompiledDic:
+    # file layout (native byte order, the file is a per-machine cache):
+    #   magic, sha256 of the sources, number of tables, table offsets,
+    #   then per table: entry count, (key_off, key_len, value_off, value_len)
+    #   per entry sorted by the utf-8 key, and the string blob
+    MAGIC = b'TTSDIC01'
+    HEADER = struct.Struct('=8s32sI')
+
+    def __init__(self, loader, table):
+        self._loader = loader
+        self._table = table
+        self._buffer = None
+        self._index = None
+        self._blob = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, path, checksum, tables):
+        table_bytes = []
+        for table in tables:
+            keys = sorted(k.encode() for k in table.keys())
+            index = array.array('I')
+            blob = bytearray()
+            for key in keys:
+                value = table[key.decode()].encode()
+                index.extend([len(blob), len(key), len(blob) + len(key), len(value)])
+                blob += key + value
+            data = struct.pack('=I', len(keys)) + index.tobytes() + bytes(blob)
+            table_bytes.append(data + b'\0' * (-len(data) % 4))
+
+        offset = cls.HEADER.size + 4 * len(tables)
+        offsets = array.array('I')
+        for data in table_bytes:
+            offsets.append(offset)
+            offset += len(data)
+
+        content = b''.join(
+            [cls.HEADER.pack(cls.MAGIC, checksum, len(tables)), offsets.tobytes()]
+            + table_bytes
         )
-        del reader, tmp_dict
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=path.parent, suffix='.tmp', delete=False
+            ) as f:
+                f.write(content)
+            os.replace(f.name, path)
+        except OSError as e:
+            logger.warning('failed to write compiled dictionary: %s', e)
+        return content
+
+    @classmethod
+    def open(cls, path, checksum, build_tables):
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if cls.HEADER.unpack_from(buffer)[:2] == (cls.MAGIC, checksum):
+                return buffer
+            buffer.close()
+        except (OSError, ValueError, struct.error):
+            pass
+
+        logger.debug('compiling dictionaries into %s', path)
+        return cls.build(path, checksum, build_tables())
+
+    def _ensure(self):
+        if self._index is not None:
+            return
+        with self._lock:
+            if self._index is not None:
+                return
+            buffer = self._loader()
+            view = memoryview(buffer)
+            start = self.HEADER.size + 4 * self._table
+            offset = view[start : start + 4].cast('I')[0]
+            count = view[offset : offset + 4].cast('I')[0]
+            self._count = count
+            self._blob = offset + 4 + 16 * count
+            self._buffer = buffer
+            self._index = view[offset + 4 : self._blob].cast('I')
+
+    def _find(self, key):
+        self._ensure()
+        key = key.encode()
+        index = self._index
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_off = self._blob + index[4 * mid]
+            candidate = self._buffer[key_off : key_off + index[4 * mid + 1]]
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _value(self, i):
+        value_off = self._blob + self._index[4 * i + 2]
+        return self._buffer[value_off : value_off + self._index[4 * i + 3]].decode()
+
+    def get(self, key, default=None):
+        if (i := self._find(key)) is None:
+            return default
+        return self._value(i)
+
+    def __getitem__(self, key):
+        if (i := self._find(key)) is None:
+            raise KeyError(key)
+        return self._value(i)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        self._ensure()
+        return self._count
+
+    def keys(self):
+        self._ensure()
+        for i in range(self._count):
+            key_off = self._blob + self._index[4 * i]
+            yield self._buffer[key_off : key_off + self._index[4 * i + 1]].decode()
+
+
+def _read_dic_csv(path):
+    tmp_dict = {}
+    if Path(path).is_file():
+        with open(path, newline='', encoding='utf-8') as f:
+            for r in csv.reader(f):
+                if len(r) == 2 and (key := r[0].lower()) not in tmp_dict:
+                    tmp_dict[key] = r[1]
+    return tmp_dict
+
+
+def _build_dic_tables():
+    english_dic = {}
+    if settings.use_alkana:
+        import alkana
+
+        english_dic.update(alkana.data.data)
+    english_dic.update(_read_dic_csv(settings.english_dic))
+    return [english_dic, _read_dic_csv(settings.user_dic)]
+
+
+def _get_dic_checksum():
+    h = hashlib.sha256(CompiledDic.MAGIC)
+    if settings.use_alkana:
+        import importlib.metadata
+
+        h.update(importlib.metadata.version('alkana').encode())
+    for path in [settings.english_dic, settings.user_dic]:
+        h.update(b'\0')
+        if Path(path).is_file():
+            h.update(Path(path).read_bytes())
+    return h.digest()
+
+
+def _compiled_dic_loader():
+    @functools.lru_cache(maxsize=1)
+    def load():
+        return CompiledDic.open(
+            Path(settings.compiled_dic), _get_dic_checksum(), _build_dic_tables
+        )
+
+    return load
+
+
+__compiled_dic_loader = _compiled_dic_loader()
+ENGLISH_DIC = CompiledDic(__compiled_dic_loader, 0)
+USER_DIC = CompiledDic(__compiled_dic_loader, 1)
+__user_dic_matcher: tuple | None = None
+__dic_reload_lock = threading.Lock()
+__dic_watcher: threading.Thread | None = None
+
+
+def _get_file_version(path):
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return ''
+    return f'{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def _get_dic_version():
+    return ','.join(
+        _get_file_version(path) for path in [settings.english_dic, settings.user_dic]
+    )
+
+
+DIC_VERSION = _get_dic_version()
 
 logger = logging.getLogger(__name__)
 
+
+class AudioCache:
+    # the disk tier is evicted below its limit so that it is not scanned on
+    # every put once it is full
+    DISK_LOW_WATER = 0.9
+
+    def __init__(self, max_bytes=0, cache_dir=None, disk_max_bytes=0, ttl=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = None
+        self._disk_evicting = False
+        self._disk_written = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                created, value = item
+                if self.ttl is None or now - created < self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+
+        created, value = self._get_from_disk(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put(key, value, created)
+            return value
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._put(key, value, now)
+        self._put_to_disk(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+            self._disk_bytes = None
+        if self.cache_dir is not None and self.cache_dir.is_dir():
+            for path in self.cache_dir.glob('*.wav'):
+                path.unlink(missing_ok=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._items),
+                'bytes': self._bytes,
+                'disk_bytes': self._disk_bytes,
+            }
+
+    def _pop(self, key):
+        _, value = self._items.pop(key)
+        self._bytes -= len(value)
+
+    def _put(self, key, value, created):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._items:
+            self._pop(key)
+        self._items[key] = (created, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            self._pop(next(iter(self._items)))
+
+    # on disk, mtime is the creation time for the ttl and atime the recency
+    def _get_from_disk(self, key, now):
+        if self.cache_dir is None or self.disk_max_bytes <= 0:
+            return None, None
+        path = self.cache_dir / f'{key}.wav'
+        try:
+            created = path.stat().st_mtime
+            if self.ttl is not None and now - created >= self.ttl:
+                path.unlink(missing_ok=True)
+                return None, None
+            value = path.read_bytes()
+            os.utime(path, (now, created))
+            return created, value
+        except OSError:
+            return None, None
+
+    def _put_to_disk(self, key, value):
+        if self.cache_dir is None or len(value) > self.disk_max_bytes:
+            return
+        path = self.cache_dir / f'{key}.wav'
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=self.cache_dir, suffix='.tmp', delete=False
+            ) as f:
+                f.write(value)
+            try:
+                replaced_size = path.stat().st_size
+            except FileNotFoundError:
+                replaced_size = 0
+            os.replace(f.name, path)
+        except OSError as e:
+            logger.warning('failed to write audio cache: %s', e)
+            return
+
+        with self._lock:
+            if self._disk_evicting:
+                self._disk_written += len(value) - replaced_size
+                return
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(value) - replaced_size
+                if self._disk_bytes <= self.disk_max_bytes:
+                    return
+            self._disk_evicting = True
+            self._disk_written = 0
+
+        # the directory is scanned without the lock, and files written in the
+        # meantime are added afterwards
+        disk_bytes = None
+        try:
+            disk_bytes = self._evict_disk()
+        finally:
+            with self._lock:
+                if disk_bytes is not None:
+                    disk_bytes += self._disk_written
+                self._disk_bytes = disk_bytes
+                self._disk_evicting = False
+
+    def _evict_disk(self):
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob('*.wav'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if self.ttl is not None and now - stat.st_mtime >= self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.disk_max_bytes:
+            return total
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes * self.DISK_LOW_WATER:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        return total
+
+
+class SoundfileEncoder:
+    def __init__(self, response_format, nchannels, sampwidth, framerate):
+        # lazily importing soundfile because it is slow
+        import soundfile as sf
+
+        if sampwidth != 2:
+            raise ValueError(f'Unsupported sample width: {sampwidth}')
+        self._buffer = bytearray()
+        self._sent = 0
+        self._pos = 0
+        # the lame tag frame is written first as a placeholder and filled in
+        # on close, which is too late for a stream, so it is left out and
+        # mp3 is encoded at a constant bitrate to be decodable without it
+        self._skip_first_write = response_format == 'mp3'
+        self._skip = 0
+        format, subtype = SOUNDFILE_FORMATS[response_format]
+        options = {}
+        if response_format == 'mp3':
+            options = {'bitrate_mode': 'CONSTANT', 'compression_level': 0.5}
+        self._file = sf.SoundFile(
+            self,
+            'w',
+            samplerate=framerate,
+            channels=nchannels,
+            format=format,
+            subtype=subtype,
+            **options,
+        )
+
+    def encode(self, data):
+        self._file.buffer_write(data, dtype='int16')
+        return self._take()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        return self._take()
+
+    def abort(self):
+        with contextlib.suppress(Exception):
+            self._file.close()
+
+    def _take(self):
+        data = bytes(self._buffer)
+        self._sent += len(data)
+        self._buffer.clear()
+        skip = min(self._skip, len(data))
+        self._skip -= skip
+        return data[skip:]
+
+    # file-like interface for libsndfile, bytes already sent cannot be changed
+    def write(self, data):
+        size = len(data)
+        if self._skip_first_write:
+            self._skip_first_write = False
+            self._skip = size
+        start = self._pos - self._sent
+        if start < 0:
+            data = data[-start:]
+            start = 0
+        self._buffer[start : start + len(data)] = data
+        self._pos = self._sent + start + len(data)
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._sent + len(self._buffer)
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def read(self, size=-1):
+        return b''
+
+
+class FfmpegEncoder:
+    def __init__(self, process):
+        self._process = process
+        self._output = queue.Queue()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while data := self._process.stdout.read1(65536):
+            self._output.put(data)
+
+    def _take(self):
+        chunks = []
+        with contextlib.suppress(queue.Empty):
+            while True:
+                chunks.append(self._output.get_nowait())
+        return b''.join(chunks)
+
+    def encode(self, data):
+        self._process.stdin.write(data)
+        self._process.stdin.flush()
+        return self._take()
+
+    def abort(self):
+        self._process.kill()
+        self._process.wait()
+
+    def close(self):
+        if self._process.stdin.closed:
+            return b''
+        self._process.stdin.close()
+        self._reader.join()
+        if self._process.wait() != 0:
+            raise RuntimeError(f'ffmpeg exited with {self._process.returncode}')
+        return self._take()
+
+
+def __spawn_ffmpeg(output_format, nchannels, framerate):
+    return subprocess.Popen(
+        [
+            settings.ffmpeg_command,
+            '-loglevel',
+            'error',
+            '-f',
+            's16le',
+            '-ar',
+            str(framerate),
+            '-ac',
+            str(nchannels),
+            '-i',
+            'pipe:0',
+            '-f',
+            output_format,
+            'pipe:1',
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def __acquire_ffmpeg(output_format, nchannels, sampwidth, framerate):
+    if sampwidth != 2:
+        raise ValueError(f'Unsupported sample width: {sampwidth}')
+    # ffmpeg takes a while to start, so processes are spawned in advance for
+    # the formats in use, each of them encodes a single response
+    key = (output_format, nchannels, framerate)
+    if settings.ffmpeg_pool_size <= 0:
+        return __spawn_ffmpeg(*key)
+
+    process = None
+    stale_procs = []
+    with __ffmpeg_lock:
+        procs = __ffmpeg_pool.setdefault(key, [])
+        __ffmpeg_pool.move_to_end(key)
+        while len(procs) > 0:
+            proc = procs.pop(0)
+            if proc.poll() is None:
+                process = proc
+                break
+            logger.warning('ffmpeg exited unexpectedly: %s', proc.returncode)
+
+        num_spawns = max(
+            settings.ffmpeg_pool_size - len(procs) - __ffmpeg_spawning.get(key, 0), 0
+        )
+        __ffmpeg_spawning[key] = __ffmpeg_spawning.get(key, 0) + num_spawns
+
+        while len(__ffmpeg_pool) > FFMPEG_POOL_MAX_FORMATS:
+            _, procs = __ffmpeg_pool.popitem(last=False)
+            stale_procs.extend(procs)
+
+    __terminate_processes(stale_procs)
+    if process is None:
+        process = __spawn_ffmpeg(*key)
+    new_procs = [__spawn_ffmpeg(*key) for _ in range(num_spawns)]
+
+    if num_spawns > 0:
+        with __ffmpeg_lock:
+            __ffmpeg_spawning[key] -= num_spawns
+            if __ffmpeg_spawning[key] <= 0:
+                del __ffmpeg_spawning[key]
+            # the format may have been evicted while spawning
+            if key in __ffmpeg_pool:
+                __ffmpeg_pool[key].extend(new_procs)
+                new_procs = []
+        __terminate_processes(new_procs)
+
+    return process
+
+
+def __terminate_processes(procs):
+    for proc in procs:
+        proc.kill()
+        proc.wait()
+
+
+@atexit.register
+def __close_ffmpeg_pool():
+    with __ffmpeg_lock:
+        while len(__ffmpeg_pool) > 0:
+            _, procs = __ffmpeg_pool.popitem()
+            __terminate_processes(procs)
+
+
 __queue: queue.Queue | None = None
-__thread: threading.Thread | None = None
+__playback_queue: queue.Queue | None = None
+__threads: list[threading.Thread] = []
+__player_thread: threading.Thread | None = None
+__worker_lock = threading.Lock()
+
+__audio_cache = AudioCache(
+    settings.audio_cache_max_bytes,
+    settings.audio_cache_dir,
+    settings.audio_cache_disk_max_bytes,
+    settings.audio_cache_ttl,
+)
+__phrase_cache = AudioCache(settings.phrase_cache_max_bytes)
+__chunk_executor: concurrent.futures.ThreadPoolExecutor | None = None
+__chunk_executor_lock = threading.Lock()
+__kanalizer_executor: concurrent.futures.ThreadPoolExecutor | None = None
+__ffmpeg_pool: collections.OrderedDict = collections.OrderedDict()
+__ffmpeg_lock = threading.Lock()
+__ffmpeg_spawning: dict = {}
+
+__stream_player: subprocess.Popen | None = None
+__stream_player_format: tuple | None = None
+__stream_player_busy_until = 0.0
+__stream_player_lock = threading.Lock()
+
+__kana_cache: collections.OrderedDict = collections.OrderedDict()
+__kanalizer_cache: collections.OrderedDict | None = None
+__kanalizer_cache_file_lock = threading.Lock()
+__kanalizer_cache_file_lines = 0
+__kana_cache_lock = threading.Lock()
+__kana_cache_stats = {
+    'hits': 0,
+    'misses': 0,
+    'kanalizer_hits': 0,
+    'kanalizer_misses': 0,
+}
+
+__open_jtalk_pool: collections.OrderedDict = collections.OrderedDict()
+__open_jtalk_lock = threading.Lock()
+__open_jtalk_spawning: dict = {}
+__open_jtalk_stats = {'hits': 0, 'misses': 0, 'respawns': 0}
 
 
 def __ensure_worker():
     global __queue
-    global __thread
+    global __playback_queue
+    global __threads
+    global __player_thread
     if __queue is None:
         __queue = queue.Queue()
-    if __thread is None:
-        __thread = threading.Thread(target=__worker, args=(__queue,), daemon=True)
-    if not __thread.is_alive():
-        try:
-            __thread.start()
-        except RuntimeError:
-            __thread = threading.Thread(target=__worker, args=(__queue,), daemon=True)
-            __thread.start()
+    if __playback_queue is None:
+        __playback_queue = queue.Queue()
+
+    __threads = [t for t in __threads if t.is_alive()]
+    while len(__threads) < max(settings.synthesis_workers, 1):
+        thread = threading.Thread(target=__worker, args=(__queue,), daemon=True)
+        thread.start()
+        __threads.append(thread)
+
+    if __player_thread is None or not __player_thread.is_alive():
+        __player_thread = threading.Thread(
+            target=__player, args=(__playback_queue,), daemon=True
+        )
+        __player_thread.start()
 
 
 def __worker(q):
     while True:
         try:
-            item = q.get()
+            buffer, is_cancelled, item = q.get()
             logger.debug(item)
-            __say(*item)
+            __produce(buffer, is_cancelled, *item)
+        except Exception:
+            logger.error(traceback.format_exc())
+
+
+def __player(q):
+    while True:
+        try:
+            buffer, is_cancelled = q.get()
+            __play(buffer, is_cancelled)
         except Exception:
             logger.error(traceback.format_exc())
 
@@ -188,16 +916,72 @@ def __say(
     use_user_dic=settings.use_user_dic,
     shorten_urls=settings.shorten_urls,
 ):
-    audio_bytes = generate_audio_bytes(
-        script,
-        speed,
-        fm,
-        english_word_min_length,
-        english_to_kana,
-        use_user_dic,
-        shorten_urls,
-    )
-    play_sound(audio_bytes)
+    buffer = queue.Queue(maxsize=max(settings.playback_buffer_size, 1))
+    is_cancelled = threading.Event()
+    threading.Thread(
+        target=__produce,
+        args=(
+            buffer,
+            is_cancelled,
+            script,
+            speed,
+            fm,
+            english_word_min_length,
+            english_to_kana,
+            use_user_dic,
+            shorten_urls,
+        ),
+        daemon=True,
+    ).start()
+    __play(buffer, is_cancelled)
+
+
+def __produce(
+    buffer,
+    is_cancelled,
+    script,
+    speed=settings.r,
+    fm=settings.fm,
+    english_word_min_length=settings.english_word_min_length,
+    english_to_kana=settings.english_to_kana,
+    use_user_dic=settings.use_user_dic,
+    shorten_urls=settings.shorten_urls,
+):
+    def put(item):
+        while not is_cancelled.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    try:
+        chunks = __iter_audio_chunks(
+            script,
+            speed,
+            fm,
+            english_word_min_length,
+            english_to_kana,
+            use_user_dic,
+            shorten_urls,
+        )
+        for audio_bytes in chunks:
+            if is_cancelled.is_set():
+                break
+            put(audio_bytes)
+    except Exception:
+        logger.error(traceback.format_exc())
+    finally:
+        put(None)
+
+
+def __play(buffer, is_cancelled):
+    try:
+        # not holding the lock while the first chunk is being synthesized
+        if (audio_bytes := buffer.get()) is not None:
+            play_sounds(itertools.chain([audio_bytes], iter(buffer.get, None)))
+    finally:
+        is_cancelled.set()
 
 
 def say(
@@ -217,18 +1001,22 @@ def say(
         raise ValueError('english_word_min_length must be positive integer')
 
     if is_threaded:
-        __ensure_worker()
-        __queue.put(
-            (
-                script,
-                speed,
-                fm,
-                english_word_min_length,
-                english_to_kana,
-                use_user_dic,
-                shorten_urls,
-            )
+        buffer = queue.Queue(maxsize=max(settings.playback_buffer_size, 1))
+        is_cancelled = threading.Event()
+        item = (
+            script,
+            speed,
+            fm,
+            english_word_min_length,
+            english_to_kana,
+            use_user_dic,
+            shorten_urls,
         )
+        # both queues must see items in the same order to keep playback ordered
+        with __worker_lock:
+            __ensure_worker()
+            __playback_queue.put((buffer, is_cancelled))
+            __queue.put((buffer, is_cancelled, item))
     else:
         __say(
             script,
@@ -249,7 +1037,104 @@ def generate_audio_bytes(
     english_to_kana=settings.english_to_kana,
     use_user_dic=settings.use_user_dic,
     shorten_urls=settings.shorten_urls,
+    response_format='wav',
+    output_sampling_rate=None,
+    output_stereo=False,
+):
+    key = __audio_cache_key(
+        script,
+        speed,
+        fm,
+        english_word_min_length,
+        english_to_kana,
+        use_user_dic,
+        shorten_urls,
+    )
+    if (audio_bytes := __audio_cache.get(key)) is not None:
+        logger.debug('audio cache hit: %s', key)
+        return encode_audio_bytes(
+            convert_audio_bytes(audio_bytes, output_sampling_rate, output_stereo),
+            response_format,
+        )
+
+    audio_bytes = __generate_audio_bytes(
+        script,
+        speed,
+        fm,
+        english_word_min_length,
+        english_to_kana,
+        use_user_dic,
+        shorten_urls,
+    )
+    if len(audio_bytes) > 0:
+        __audio_cache.put(key, audio_bytes)
+    return encode_audio_bytes(
+        convert_audio_bytes(audio_bytes, output_sampling_rate, output_stereo),
+        response_format,
+    )
+
+
+def __generate_audio_bytes(
+    script,
+    speed,
+    fm,
+    english_word_min_length,
+    english_to_kana,
+    use_user_dic,
+    shorten_urls,
 ):
+    results = __generate_audio_chunks(
+        script,
+        speed,
+        fm,
+        english_word_min_length,
+        english_to_kana,
+        use_user_dic,
+        shorten_urls,
+    )
+    return join_audio_bytes_list(list(results))
+
+
+def __generate_audio_chunks(
+    script,
+    speed,
+    fm,
+    english_word_min_length,
+    english_to_kana,
+    use_user_dic,
+    shorten_urls,
+):
+    texts = __generate_texts(
+        script, english_word_min_length, english_to_kana, use_user_dic, shorten_urls
+    )
+    if settings.max_parallel_chunks <= 1:
+        for text in texts:
+            audio_bytes = __synthesize(text, speed, fm)
+            if len(audio_bytes) > 0:
+                yield audio_bytes
+        return
+
+    # keep at most max_parallel_chunks of this request in flight, in order
+    executor = __ensure_chunk_executor()
+    futures = collections.deque()
+    try:
+        for text in texts:
+            futures.append(executor.submit(__synthesize, text, speed, fm))
+            if len(futures) >= settings.max_parallel_chunks:
+                if len(audio_bytes := futures.popleft().result()) > 0:
+                    yield audio_bytes
+        while len(futures) > 0:
+            if len(audio_bytes := futures.popleft().result()) > 0:
+                yield audio_bytes
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def __generate_texts(
+    script, english_word_min_length, english_to_kana, use_user_dic, shorten_urls
+):
+    __ensure_dic_watcher()
     logger.debug(script)
     all_lines = [l for l in script.splitlines() if len(l.strip()) > 0]
     batch_lines = [
@@ -257,7 +1142,6 @@ def generate_audio_bytes(
         for i in range(0, len(all_lines), settings.batch_num_lines)
     ]
 
-    results = []
     for batch_text in batch_lines:
         logger.debug(batch_text)
         text = remove_bad_characters(batch_text)
@@ -270,86 +1154,653 @@ def generate_audio_bytes(
 
         texts = split_text_by_max_bytes(text)
         for text in texts:
-            if len(text.strip()) == 0:
-                continue
+            if len(text.strip()) > 0:
+                yield text
 
-            cmd_jtalk = [
-                'open_jtalk',
-                '-x',
-                settings.open_jtalk_dic,
-                '-m',
-                settings.htsvoice,
-                '-ow',
-                '/dev/stdout',
-                '-r',
-                '{:f}'.format(speed),
-                '-fm',
-                '{:f}'.format(fm),
-            ]
-
-            p_jtalk = subprocess.Popen(
-                cmd_jtalk,
-                shell=False,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
+
+def __ensure_chunk_executor():
+    global __chunk_executor
+    with __chunk_executor_lock:
+        if __chunk_executor is None:
+            __chunk_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(settings.chunk_workers, 1)
             )
+        return __chunk_executor
 
-            try:
-                audio_bytes, _ = p_jtalk.communicate(
-                    input=text.encode(), timeout=settings.open_jtalk_timeout
+
+def __ensure_kanalizer_executor():
+    global __kanalizer_executor
+    with __chunk_executor_lock:
+        if __kanalizer_executor is None:
+            __kanalizer_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=settings.kanalizer_workers
+            )
+        return __kanalizer_executor
+
+
+def generate_audio_stream(
+    script,
+    speed=settings.r,
+    fm=settings.fm,
+    english_word_min_length=settings.english_word_min_length,
+    english_to_kana=settings.english_to_kana,
+    use_user_dic=settings.use_user_dic,
+    shorten_urls=settings.shorten_urls,
+    response_format='wav',
+    output_sampling_rate=None,
+    output_stereo=False,
+):
+    chunks = __iter_audio_chunks(
+        script,
+        speed,
+        fm,
+        english_word_min_length,
+        english_to_kana,
+        use_user_dic,
+        shorten_urls,
+    )
+
+    # chunks are converted one by one so that streaming is not delayed
+    chunks = __convert_audio_chunks(chunks, output_sampling_rate, output_stereo)
+    yield from __encode_audio_chunks(chunks, response_format)
+
+
+def __iter_audio_chunks(
+    script,
+    speed,
+    fm,
+    english_word_min_length,
+    english_to_kana,
+    use_user_dic,
+    shorten_urls,
+):
+    key = __audio_cache_key(
+        script,
+        speed,
+        fm,
+        english_word_min_length,
+        english_to_kana,
+        use_user_dic,
+        shorten_urls,
+    )
+    if (audio_bytes := __audio_cache.get(key)) is not None:
+        logger.debug('audio cache hit: %s', key)
+        yield audio_bytes
+        return
+
+    results = []
+    chunks = __generate_audio_chunks(
+        script,
+        speed,
+        fm,
+        english_word_min_length,
+        english_to_kana,
+        use_user_dic,
+        shorten_urls,
+    )
+    for audio_bytes in chunks:
+        results.append(audio_bytes)
+        yield audio_bytes
+
+    if len(results) > 0:
+        __audio_cache.put(key, join_audio_bytes_list(results))
+
+
+def encode_audio_bytes(audio_bytes, response_format='wav'):
+    if response_format == 'wav' or len(audio_bytes) == 0:
+        return audio_bytes
+    if response_format not in SOUNDFILE_FORMATS:
+        return b''.join(__encode_audio_chunks([audio_bytes], response_format))
+
+    # lazily importing soundfile because it is slow
+    import numpy as np
+    import soundfile as sf
+
+    if response_format == 'opus':
+        audio_bytes = __convert_for_opus(audio_bytes)
+
+    # a seekable buffer lets the encoder finish the headers with the real length
+    nchannels, sampwidth, framerate, data = __parse_wav(audio_bytes)
+    if sampwidth != 2:
+        raise ValueError(f'Unsupported sample width: {sampwidth}')
+    frames = np.frombuffer(data, dtype='<i2').reshape(-1, nchannels)
+    format, subtype = SOUNDFILE_FORMATS[response_format]
+    result = io.BytesIO()
+    sf.write(result, frames, framerate, format=format, subtype=subtype)
+    return result.getvalue()
+
+
+def __encode_audio_chunks(chunks, response_format):
+    if response_format not in AUDIO_MEDIA_TYPES:
+        raise ValueError(f'Unsupported response_format: {response_format}')
+
+    encoder = None
+    fmt = None
+    try:
+        for audio_bytes in chunks:
+            if len(audio_bytes) == 0:
+                continue
+            if response_format == 'opus':
+                audio_bytes = __convert_for_opus(audio_bytes)
+            nchannels, sampwidth, framerate, data = __parse_wav(audio_bytes)
+            if fmt is None:
+                fmt = (nchannels, sampwidth, framerate)
+                if response_format == 'wav':
+                    yield __make_wav_header(*fmt)
+                elif response_format in SOUNDFILE_FORMATS:
+                    encoder = SoundfileEncoder(response_format, *fmt)
+                elif response_format == 'aac':
+                    encoder = FfmpegEncoder(__acquire_ffmpeg('adts', *fmt))
+            elif fmt != (nchannels, sampwidth, framerate):
+                raise ValueError(
+                    f'Mismatched audio format: {(nchannels, sampwidth, framerate)} != {fmt}'
                 )
-                if len(audio_bytes) > 0:
-                    results.append(audio_bytes)
-            except subprocess.TimeoutExpired as e:
-                logger.error(e)
 
-    return join_audio_bytes_list(results)
+            if encoder is None:
+                yield data.tobytes()
+            elif len(encoded := encoder.encode(data)) > 0:
+                yield encoded
+
+        if encoder is not None and len(encoded := encoder.close()) > 0:
+            yield encoded
+    except BaseException:
+        if encoder is not None:
+            encoder.abort()
+        raise
+
+
+def __convert_for_opus(audio_bytes):
+    # opus only supports a few sampling rates, others are encoded at 48 kHz
+    nchannels, _, framerate, _ = __parse_wav(audio_bytes)
+    if framerate in OPUS_SAMPLING_RATES:
+        return audio_bytes
+    return convert_audio_bytes(audio_bytes, 48000, nchannels == 2)
+
+
+def convert_audio_bytes(audio_bytes, output_sampling_rate=None, output_stereo=False):
+    if len(audio_bytes) == 0:
+        return audio_bytes
+    nchannels, sampwidth, framerate, data = __parse_wav(audio_bytes)
+    output_nchannels = 2 if output_stereo else 1
+    output_framerate = output_sampling_rate or framerate
+    if output_sampling_rate is not None and output_sampling_rate <= 0:
+        raise ValueError('output_sampling_rate must be positive')
+    if (nchannels, framerate) == (output_nchannels, output_framerate):
+        return audio_bytes
+    if sampwidth != 2:
+        raise ValueError(f'Unsupported sample width: {sampwidth}')
+
+    # lazily importing numpy because it is slow
+    import numpy as np
+
+    frames = np.frombuffer(data, dtype='<i2').reshape(-1, nchannels)
+    frames = frames.astype(np.float32)
+    if output_framerate != framerate:
+        frames = __resample(frames, framerate, output_framerate)
+    if output_nchannels == 1 and nchannels > 1:
+        frames = frames.mean(axis=1, keepdims=True)
+    elif output_nchannels > nchannels:
+        frames = np.repeat(frames[:, :1], output_nchannels, axis=1)
+
+    data = np.clip(np.rint(frames), -32768, 32767).astype('<i2').tobytes()
+    header = __make_wav_header(output_nchannels, 2, output_framerate, len(data))
+    return header + data
+
+
+def __convert_audio_chunks(chunks, output_sampling_rate, output_stereo):
+    for audio_bytes in chunks:
+        yield convert_audio_bytes(audio_bytes, output_sampling_rate, output_stereo)
+
+
+def __resample(frames, framerate, output_framerate):
+    import numpy as np
+
+    gcd = math.gcd(framerate, output_framerate)
+    up = output_framerate // gcd
+    down = framerate // gcd
+    taps, width = __resample_filter(up, down)
+
+    # output frame k lies at k * down on the upsampled grid, that is at phase
+    # p after input frame i0, and is the taps of phase p applied to the input
+    # frames around i0
+    nframes = -(-len(frames) * up // down)
+    padded = np.pad(frames, ((width, width + 1), (0, 0)))
+    offsets = np.arange(taps.shape[1])
+    result = np.empty((nframes, frames.shape[1]), dtype=np.float32)
+    for start in range(0, nframes, RESAMPLE_BLOCK_SIZE):
+        positions = np.arange(start, min(start + RESAMPLE_BLOCK_SIZE, nframes)) * down
+        window = padded[(positions // up)[:, None] + offsets]
+        result[start : start + len(positions)] = np.einsum(
+            'kt,ktc->kc', taps[positions % up], window
+        )
+    return result
+
+
+@functools.lru_cache(maxsize=16)
+def __resample_filter(up, down):
+    import numpy as np
+
+    # kaiser windowed sinc with its cutoff at the lower nyquist frequency,
+    # sampled on the upsampled grid and split into one row of taps per phase
+    factor = max(up, down)
+    radius = RESAMPLE_ZERO_CROSSINGS * factor
+    width = -(-radius // up)
+    distances = np.arange(up)[:, None] - np.arange(-width, width + 2) * up
+    x = np.clip(distances / radius, -1, 1)
+    taps = np.sinc(distances / factor) * np.i0(
+        RESAMPLE_KAISER_BETA * np.sqrt(1 - x * x)
+    )
+    taps[np.abs(distances) > radius] = 0
+    taps /= taps.sum(axis=1, keepdims=True)
+    return taps.astype(np.float32), width
+
+
+def __make_wav_header(nchannels, sampwidth, framerate, data_size=0xFFFFFFFF):
+    riff_size = 0xFFFFFFFF if data_size == 0xFFFFFFFF else data_size + 36
+    block_align = nchannels * sampwidth
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF',
+        riff_size,
+        b'WAVE',
+        b'fmt ',
+        16,
+        1,
+        nchannels,
+        framerate,
+        framerate * block_align,
+        block_align,
+        sampwidth * 8,
+        b'data',
+        data_size,
+    )
+
+
+def __synthesize(text, speed, fm):
+    params = [text, float(speed), float(fm), settings.htsvoice]
+    key = hashlib.sha256(json.dumps(params, ensure_ascii=False).encode()).hexdigest()
+    if (audio_bytes := __phrase_cache.get(key)) is not None:
+        return audio_bytes
+
+    p_jtalk = __acquire_open_jtalk(speed, fm)
+    try:
+        audio_bytes, _ = p_jtalk.communicate(
+            input=text.encode(), timeout=settings.open_jtalk_timeout
+        )
+    except subprocess.TimeoutExpired as e:
+        p_jtalk.kill()
+        p_jtalk.communicate()
+        logger.error(e)
+        return b''
+
+    if len(audio_bytes) > 0:
+        __phrase_cache.put(key, audio_bytes)
+    return audio_bytes
+
+
+def __spawn_open_jtalk(speed, fm):
+    cmd_jtalk = [
+        'open_jtalk',
+        '-x',
+        settings.open_jtalk_dic,
+        '-m',
+        settings.htsvoice,
+        '-ow',
+        '/dev/stdout',
+        '-r',
+        '{:f}'.format(speed),
+        '-fm',
+        '{:f}'.format(fm),
+    ]
+
+    return subprocess.Popen(
+        cmd_jtalk,
+        shell=False,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def __acquire_open_jtalk(speed, fm):
+    # open_jtalk loads the dictionary and the voice before reading stdin,
+    # so processes spawned in advance are ready to synthesize immediately
+    if settings.open_jtalk_pool_size <= 0:
+        return __spawn_open_jtalk(speed, fm)
+
+    # every chunk synthesized in parallel takes its own process
+    pool_size = max(settings.open_jtalk_pool_size, settings.max_parallel_chunks)
+    key = (float(speed), float(fm))
+    p_jtalk = None
+    stale_procs = []
+    with __open_jtalk_lock:
+        procs = __open_jtalk_pool.setdefault(key, [])
+        __open_jtalk_pool.move_to_end(key)
+        while len(procs) > 0:
+            proc = procs.pop(0)
+            if proc.poll() is None:
+                p_jtalk = proc
+                break
+            logger.warning('open_jtalk exited unexpectedly: %s', proc.returncode)
+            __open_jtalk_stats['respawns'] += 1
+
+        if p_jtalk is None:
+            __open_jtalk_stats['misses'] += 1
+        else:
+            __open_jtalk_stats['hits'] += 1
+
+        num_spawns = max(pool_size - len(procs) - __open_jtalk_spawning.get(key, 0), 0)
+        __open_jtalk_spawning[key] = __open_jtalk_spawning.get(key, 0) + num_spawns
+
+        while len(__open_jtalk_pool) > max(settings.open_jtalk_pool_max_params, 1):
+            _, procs = __open_jtalk_pool.popitem(last=False)
+            stale_procs.extend(procs)
+
+    # spawning and killing processes is slow, so it is done without the lock
+    __terminate_processes(stale_procs)
+    if p_jtalk is None:
+        p_jtalk = __spawn_open_jtalk(speed, fm)
+    new_procs = [__spawn_open_jtalk(speed, fm) for _ in range(num_spawns)]
+
+    if num_spawns > 0:
+        with __open_jtalk_lock:
+            __open_jtalk_spawning[key] -= num_spawns
+            if __open_jtalk_spawning[key] <= 0:
+                del __open_jtalk_spawning[key]
+            # the parameters may have been evicted while spawning
+            if key in __open_jtalk_pool:
+                __open_jtalk_pool[key].extend(new_procs)
+                new_procs = []
+        __terminate_processes(new_procs)
+
+    return p_jtalk
+
+
+@atexit.register
+def __close_open_jtalk_pool():
+    with __open_jtalk_lock:
+        while len(__open_jtalk_pool) > 0:
+            _, procs = __open_jtalk_pool.popitem()
+            __terminate_processes(procs)
+
+
+def get_open_jtalk_stats():
+    with __open_jtalk_lock:
+        return {
+            **__open_jtalk_stats,
+            'pooled': sum(len(procs) for procs in __open_jtalk_pool.values()),
+        }
+
+
+def __audio_cache_key(
+    script,
+    speed,
+    fm,
+    english_word_min_length,
+    english_to_kana,
+    use_user_dic,
+    shorten_urls,
+):
+    all_lines = [l for l in script.splitlines() if len(l.strip()) > 0]
+    params = [
+        '\n'.join(all_lines),
+        float(speed),
+        float(fm),
+        english_word_min_length,
+        english_to_kana,
+        use_user_dic,
+        shorten_urls,
+        settings.htsvoice,
+        settings.batch_num_lines,
+        settings.batch_max_bytes,
+        settings.use_alkana,
+        settings.use_kanalizer,
+        DIC_VERSION,
+    ]
+    return hashlib.sha256(json.dumps(params, ensure_ascii=False).encode()).hexdigest()
+
+
+def clear_audio_cache():
+    __audio_cache.clear()
+    __phrase_cache.clear()
+
+
+def get_audio_cache_stats():
+    return __audio_cache.stats()
+
+
+def get_phrase_cache_stats():
+    return __phrase_cache.stats()
 
 
 def play_sound(
     audio_bytes,
-    command=settings.play_command,
+    command=None,
+    timeout=settings.play_timeout,
+    speaker_idx=settings.speaker_idx,
+):
+    play_sounds([audio_bytes], command, timeout, speaker_idx)
+
+
+@fasteners.interprocess_locked(settings.lock_file)
+def play_sounds(
+    audio_bytes_list,
+    command=None,
     timeout=settings.play_timeout,
     speaker_idx=settings.speaker_idx,
 ):
+    # the stream player is used unless a command is passed explicitly
+    if command is None:
+        if settings.play_stream_command:
+            with __stream_player_lock:
+                for audio_bytes in audio_bytes_list:
+                    __play_sound_with_stream_command(audio_bytes)
+                # the sink buffers audio, so the lock is kept until it has been played
+                __wait_stream_player(timeout)
+            return
+        command = settings.play_command
+
     if command:
-        play_sound_with_external_command(audio_bytes, command, timeout)
-    else:
-        play_sound_with_soundcard(audio_bytes, speaker_idx)
+        __play_sounds_with_external_command(audio_bytes_list, command, timeout)
+        return
+
+    for audio_bytes in audio_bytes_list:
+        __play_sound_with_soundcard(audio_bytes, speaker_idx)
 
 
 @fasteners.interprocess_locked(settings.lock_file)
 def play_sound_with_external_command(
     audio_bytes, command=settings.play_command, timeout=settings.play_timeout
 ):
-    p_play = subprocess.Popen(
-        command,
-        shell=False,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+    __play_sounds_with_external_command([audio_bytes], command, timeout)
 
+
+def __play_sounds_with_external_command(audio_bytes_list, command, timeout):
+    # one player per utterance gets a wav header without a length followed
+    # by the data of every chunk, so that there are no gaps between chunks
+    p_play = None
+    fmt = None
     try:
-        p_play.communicate(input=audio_bytes, timeout=timeout)
+        for audio_bytes in audio_bytes_list:
+            if len(audio_bytes) == 0:
+                continue
+            nchannels, sampwidth, framerate, data = __parse_wav(audio_bytes)
+            if p_play is not None and fmt != (nchannels, sampwidth, framerate):
+                __wait_external_command(p_play, timeout)
+                p_play = None
+            if p_play is None:
+                fmt = (nchannels, sampwidth, framerate)
+                p_play = subprocess.Popen(
+                    command,
+                    shell=False,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                p_play.stdin.write(__make_wav_header(*fmt))
+            p_play.stdin.write(data)
+    except OSError as e:
+        logger.error('player failed: %s', e)
+    finally:
+        if p_play is not None:
+            __wait_external_command(p_play, timeout)
+
+
+def __wait_external_command(p_play, timeout):
+    try:
+        with contextlib.suppress(OSError):
+            p_play.stdin.close()
+        p_play.wait(timeout=timeout)
     except subprocess.TimeoutExpired as e:
         p_play.terminate()
         logger.error(e)
 
 
+def __parse_wav(audio_bytes):
+    view = memoryview(audio_bytes)
+    if view[0:4] != b'RIFF' or view[8:12] != b'WAVE':
+        raise ValueError('not a WAV file')
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = view[offset : offset + 4].tobytes()
+        (chunk_size,) = struct.unpack_from('<I', view, offset + 4)
+        if chunk_id == b'fmt ':
+            _, nchannels, framerate, _, _, bits = struct.unpack_from(
+                '<HHIIHH', view, offset + 8
+            )
+            fmt = (nchannels, bits // 8, framerate)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError('no fmt chunk before the data chunk')
+            return *fmt, view[offset + 8 : offset + 8 + chunk_size]
+        offset += 8 + chunk_size + chunk_size % 2
+    raise ValueError('no data chunk')
+
+
+def __ensure_stream_player(fmt):
+    global __stream_player
+    global __stream_player_format
+    if __stream_player is not None and __stream_player.poll() is not None:
+        logger.warning('stream player exited with %s', __stream_player.returncode)
+        __stream_player = None
+    if __stream_player is not None and __stream_player_format != fmt:
+        __wait_stream_player()
+        __close_stream_player()
+
+    if __stream_player is None:
+        nchannels, sampwidth, framerate = fmt
+        command = settings.play_stream_command
+        if isinstance(command, str):
+            command = shlex.split(command)
+        __stream_player = subprocess.Popen(
+            [
+                arg.format(channels=nchannels, bits=sampwidth * 8, rate=framerate)
+                for arg in command
+            ],
+            shell=False,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        __stream_player_format = fmt
+    return __stream_player
+
+
+def __play_sound_with_stream_command(audio_bytes):
+    global __stream_player_busy_until
+    nchannels, sampwidth, framerate, data = __parse_wav(audio_bytes)
+    fmt = (nchannels, sampwidth, framerate)
+    for _ in range(2):
+        player = __ensure_stream_player(fmt)
+        try:
+            player.stdin.write(data)
+            player.stdin.flush()
+            break
+        except OSError as e:
+            # reconnect once, the sink may have been restarted
+            logger.error('stream player failed: %s', e)
+            __close_stream_player()
+    else:
+        return
+
+    duration = len(data) / (nchannels * sampwidth * framerate)
+    now = time.monotonic()
+    __stream_player_busy_until = max(__stream_player_busy_until, now) + duration
+
+
+def __wait_stream_player(timeout=None):
+    delay = __stream_player_busy_until - time.monotonic()
+    if timeout is not None and delay > timeout:
+        time.sleep(timeout)
+        logger.error('stream player timed out after %s seconds', timeout)
+        __close_stream_player()
+    elif delay > 0:
+        time.sleep(delay)
+
+
+@atexit.register
+def __close_stream_player():
+    global __stream_player
+    global __stream_player_busy_until
+    if __stream_player is None:
+        return
+    player = __stream_player
+    __stream_player = None
+    __stream_player_busy_until = 0.0
+    try:
+        player.stdin.close()
+        player.wait(timeout=1)
+    except (OSError, subprocess.TimeoutExpired):
+        player.kill()
+        player.wait()
+
+
 @fasteners.interprocess_locked(settings.lock_file)
 def play_sound_with_soundcard(audio_bytes, speaker_idx=settings.speaker_idx):
+    __play_sound_with_soundcard(audio_bytes, speaker_idx)
+
+
+def __play_sound_with_soundcard(audio_bytes, speaker_idx):
+    # lazily importing numpy because it is only needed by soundcard
+    import numpy as np
+
+    nchannels, sampwidth, framerate, data = __parse_wav(audio_bytes)
+    if sampwidth != 2:
+        raise ValueError(f'Unsupported sample width: {sampwidth}')
+
+    # int16 frames are viewed in place and converted block by block
+    frames = np.frombuffer(data, dtype='<i2').reshape(-1, nchannels)
+    block_size = max(settings.play_block_size, 1)
+    block = np.empty((min(block_size, len(frames)), nchannels), dtype=np.float32)
+    i = 0
+    for retry in [True, False]:
+        speaker = __get_speaker(speaker_idx)
+        try:
+            with speaker.player(samplerate=framerate, channels=nchannels) as player:
+                while i < len(frames):
+                    n = min(block_size, len(frames) - i)
+                    np.multiply(frames[i : i + n], 1 / 32768, out=block[:n])
+                    player.play(block[:n])
+                    i += n
+            return
+        except Exception as e:
+            # the speaker may have been unplugged or the default one changed,
+            # so it is looked up again and playback resumes where it stopped
+            __get_speaker.cache_clear()
+            if not retry:
+                raise
+            logger.warning('retrying playback: %s', e)
+
+
+@functools.cache
+def __get_speaker(speaker_idx):
     # lazily importing soundcard because it is slow
     import soundcard as sc
 
-    frames, samplerate = sf.read(io.BytesIO(audio_bytes))
     if speaker_idx is None:
-        speaker = sc.default_speaker()
-    else:
-        speaker = sc.all_speakers()[speaker_idx]
-
-    speaker.play(frames, samplerate)
+        return sc.default_speaker()
+    return sc.all_speakers()[speaker_idx]
 
 
 def remove_bad_characters(text):
@@ -366,18 +1817,70 @@ def replace_urls(text):
 
 
 def apply_user_dic(text):
-    if len(USER_DIC) == 0 or USER_DATA_REGEX is None:
+    user_dic, matcher = __get_user_dic_matcher()
+    if len(user_dic) == 0:
         return text
 
-    def replacer(match):
-        matched_text = match.group(0)
-        return USER_DIC[matched_text.lower()]
+    def replacer(matched_text):
+        return user_dic[matched_text.lower()]
 
-    result = USER_DATA_REGEX.sub(replacer, text)
+    result = matcher.sub(replacer, text)
     logger.debug(result)
     return result
 
 
+def __get_user_dic_matcher():
+    global __user_dic_matcher
+    user_dic = USER_DIC
+    if __user_dic_matcher is None or __user_dic_matcher[0] is not user_dic:
+        __user_dic_matcher = (user_dic, KeywordMatcher(user_dic.keys()))
+    return __user_dic_matcher
+
+
+def reload_dictionaries(force=False):
+    global ENGLISH_DIC, USER_DIC, DIC_VERSION, __user_dic_matcher
+    with __dic_reload_lock:
+        version = _get_dic_version()
+        if not force and version == DIC_VERSION:
+            return False
+
+        loader = _compiled_dic_loader()
+        english_dic = CompiledDic(loader, 0)
+        user_dic = CompiledDic(loader, 1)
+        matcher = KeywordMatcher(user_dic.keys())
+        len(english_dic)
+
+        # kana cache entries are keyed by the version they were converted
+        # with, so conversions still running cannot refill it with stale kana
+        with __kana_cache_lock:
+            __user_dic_matcher = (user_dic, matcher)
+            ENGLISH_DIC, USER_DIC, DIC_VERSION = english_dic, user_dic, version
+            __kana_cache.clear()
+    logger.info('reloaded dictionaries: %s', version)
+    return True
+
+
+def __ensure_dic_watcher():
+    global __dic_watcher
+    if settings.dic_watch_interval <= 0:
+        return
+    if __dic_watcher is not None and __dic_watcher.is_alive():
+        return
+    with __dic_reload_lock:
+        if __dic_watcher is None or not __dic_watcher.is_alive():
+            __dic_watcher = threading.Thread(target=__watch_dictionaries, daemon=True)
+            __dic_watcher.start()
+
+
+def __watch_dictionaries():
+    while True:
+        time.sleep(settings.dic_watch_interval)
+        try:
+            reload_dictionaries()
+        except Exception as e:
+            logger.error('failed to reload dictionaries: %s', e)
+
+
 def convert_english_to_kana(
     text, english_word_min_length=settings.english_word_min_length
 ):
@@ -385,24 +1888,46 @@ def convert_english_to_kana(
         raise ValueError('english_word_min_length must be positive integer')
 
     # https://mackro.blog.jp/archives/8479732.html
-    output = ''
-    while word := re.search(r'[a-zA-Z]{' f'{english_word_min_length}' r',} ?', text):
-        converted = word_to_kana(word.group().rstrip(), english_word_min_length)
-        if word.group() == f'{converted} ':
+    def replacer(match):
+        word = match.group()
+        converted = word_to_kana(word.rstrip(), english_word_min_length)
+        if word == f'{converted} ':
             converted += ' '
+        return converted
 
-        output += text[: word.start()] + converted
-        text = text[word.end() :]
-
-    result = output + text
+    regex = __english_word_regex(english_word_min_length)
+    __prefetch_kanalizer(m.group().rstrip() for m in regex.finditer(text))
+    result = regex.sub(replacer, text)
     logger.debug(result)
     return result
 
 
+@functools.lru_cache(maxsize=16)
+def __english_word_regex(english_word_min_length):
+    return re.compile(r'[a-zA-Z]{' f'{english_word_min_length}' r',} ?')
+
+
 def word_to_kana(word, english_word_min_length=settings.english_word_min_length):
     if not isinstance(english_word_min_length, int) or english_word_min_length < 1:
         raise ValueError('english_word_min_length must be positive integer')
 
+    with __kana_cache_lock:
+        key = (DIC_VERSION, word)
+        if (kana := __kana_cache.get(key)) is not None:
+            __kana_cache.move_to_end(key)
+            __kana_cache_stats['hits'] += 1
+            return kana
+        __kana_cache_stats['misses'] += 1
+
+    kana = __word_to_kana(word)
+    with __kana_cache_lock:
+        __kana_cache[key] = kana
+        while len(__kana_cache) > max(settings.kana_cache_size, 0):
+            __kana_cache.popitem(last=False)
+    return kana
+
+
+def __word_to_kana(word):
     if kana := ENGLISH_DIC.get(word.lower()):
         return kana
     else:
@@ -426,45 +1951,173 @@ def word_to_kana(word, english_word_min_length=settings.english_word_min_length)
         if settings.use_kanalizer:
             if re.fullmatch('[A-Z]{3}|w+', word):
                 return word
-            try:
-                kanalizer_result = kanalizer.convert(
-                    word.lower(), on_incomplete='error', on_invalid_input='warning'
-                )
-            except kanalizer.IncompleteConversionError as e:
-                if settings.debug_kanalizer:
-                    logger.debug('[kanalizer] %s -> %s', word, e)
-                return e.incomplete_output
-
-            if settings.debug_kanalizer:
-                logger.debug('[kanalizer] %s -> %s', word, kanalizer_result)
-            return kanalizer_result
+            return __kanalizer_convert(word)
 
         return word
 
 
+def __prefetch_kanalizer(words):
+    if not settings.use_kanalizer:
+        return
+
+    unknown_words = set()
+    for word in set(words):
+        with __kana_cache_lock:
+            if (DIC_VERSION, word) in __kana_cache:
+                continue
+        __collect_kanalizer_words(word, unknown_words)
+
+    with __kana_cache_lock:
+        if __kanalizer_cache is not None:
+            unknown_words.difference_update(__kanalizer_cache.keys())
+
+    if len(unknown_words) == 0:
+        return
+    logger.debug('[kanalizer] prefetching %s', unknown_words)
+    if settings.kanalizer_workers <= 1 or len(unknown_words) == 1:
+        for word in unknown_words:
+            __kanalizer_convert(word)
+    else:
+        list(__ensure_kanalizer_executor().map(__kanalizer_convert, unknown_words))
+
+
+def __collect_kanalizer_words(word, unknown_words):
+    # mirrors __word_to_kana without calling kanalizer
+    if ENGLISH_DIC.get(word.lower()):
+        return
+    if re.fullmatch(r'(?:[A-Za-z][a-z]+)(?:[A-Z](?:[a-z]+|[A-Z]+))+', word):
+        m = re.match(r'[A-Za-z][a-z]+', word)
+        __collect_kanalizer_words(m.group(), unknown_words)
+        __collect_kanalizer_words(word[m.end() :], unknown_words)
+        return
+    if not re.fullmatch('[A-Z]{3}|w+', word):
+        unknown_words.add(word.lower())
+
+
+def __kanalizer_convert(word):
+    word = word.lower()
+    __ensure_kanalizer_cache()
+    with __kana_cache_lock:
+        if (kana := __kanalizer_cache.get(word)) is not None:
+            __kanalizer_cache.move_to_end(word)
+            __kana_cache_stats['kanalizer_hits'] += 1
+            return kana
+        __kana_cache_stats['kanalizer_misses'] += 1
+
+    # lazily importing kanalizer because it is slow
+    import kanalizer
+
+    try:
+        kana = kanalizer.convert(
+            word, on_incomplete='error', on_invalid_input='warning'
+        )
+        if settings.debug_kanalizer:
+            logger.debug('[kanalizer] %s -> %s', word, kana)
+    except kanalizer.IncompleteConversionError as e:
+        if settings.debug_kanalizer:
+            logger.debug('[kanalizer] %s -> %s', word, e)
+        kana = e.incomplete_output
+
+    with __kana_cache_lock:
+        __kanalizer_cache[word] = kana
+        while len(__kanalizer_cache) > max(settings.kanalizer_cache_size, 0):
+            __kanalizer_cache.popitem(last=False)
+    __append_kanalizer_cache_file(word, kana)
+    return kana
+
+
+def __ensure_kanalizer_cache():
+    global __kanalizer_cache, __kanalizer_cache_file_lines
+    if __kanalizer_cache is not None:
+        return
+    # the file is read without the lock, the first loader wins
+    cache, num_lines = __load_kanalizer_cache()
+    with __kana_cache_lock:
+        if __kanalizer_cache is None:
+            __kanalizer_cache = cache
+            __kanalizer_cache_file_lines = num_lines
+
+
+def __append_kanalizer_cache_file(word, kana):
+    global __kanalizer_cache_file_lines
+    if not settings.kanalizer_cache_file:
+        return
+    path = Path(settings.kanalizer_cache_file)
+    # the file is shared by vsay, jsay and the server workers
+    with __kanalizer_cache_file_lock, fasteners.InterProcessLock(f'{path}.lock'):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps([word, kana], ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.warning('failed to write kanalizer cache: %s', e)
+            return
+        __kanalizer_cache_file_lines += 1
+        # the file only grows by appending, so it is rewritten once it has
+        # about twice as many lines as the cache holds
+        if __kanalizer_cache_file_lines <= 2 * max(settings.kanalizer_cache_size, 1):
+            return
+
+        # every conversion is appended, so the latest entries in the file
+        # include the ones appended by other processes since this one loaded
+        cache, _ = __load_kanalizer_cache()
+        content = ''.join(
+            json.dumps(item, ensure_ascii=False) + '\n' for item in cache.items()
+        )
+        try:
+            with tempfile.NamedTemporaryFile(
+                'w', dir=path.parent, suffix='.tmp', delete=False, encoding='utf-8'
+            ) as f:
+                f.write(content)
+            os.replace(f.name, path)
+        except OSError as e:
+            logger.warning('failed to compact kanalizer cache: %s', e)
+            return
+        __kanalizer_cache_file_lines = len(cache)
+
+
+def __load_kanalizer_cache():
+    cache = collections.OrderedDict()
+    num_lines = 0
+    if settings.kanalizer_cache_file and Path(settings.kanalizer_cache_file).is_file():
+        with open(settings.kanalizer_cache_file, encoding='utf-8') as f:
+            for line in f:
+                num_lines += 1
+                try:
+                    word, kana = json.loads(line)
+                except ValueError:
+                    continue
+                cache[word] = kana
+                cache.move_to_end(word)
+                if len(cache) > max(settings.kanalizer_cache_size, 0):
+                    cache.popitem(last=False)
+    return cache, num_lines
+
+
+def get_kana_cache_stats():
+    with __kana_cache_lock:
+        return {
+            **__kana_cache_stats,
+            'entries': len(__kana_cache),
+            'kanalizer_entries': len(__kanalizer_cache or {}),
+        }
+
+
 def join_audio_bytes_list(audio_bytes_list):
     if len(audio_bytes_list) == 1:
         return audio_bytes_list[0]
 
-    if sum(len(b) for b in audio_bytes_list) == 0:
+    # data chunks are sliced out of the inputs and copied once into the result
+    wavs = [__parse_wav(b) for b in audio_bytes_list if len(b) > 0]
+    if len(wavs) == 0:
         return b''
 
-    result_bytes = io.BytesIO()
-    is_properties_set = False
-    with wave.open(result_bytes, 'wb') as fw:
-        for audio_bytes in audio_bytes_list:
-            if len(audio_bytes) == 0:
-                continue
-            with wave.open(io.BytesIO(audio_bytes), 'rb') as fr:
-                if not is_properties_set:
-                    fw.setsampwidth(fr.getsampwidth())
-                    fw.setnchannels(fr.getnchannels())
-                    fw.setframerate(fr.getframerate())
-                    is_properties_set = True
-                fw.writeframes(fr.readframes(fr.getnframes()))
-
-    result_bytes.seek(0)
-    return result_bytes.read()
+    fmt = wavs[0][:3]
+    for wav in wavs:
+        if wav[:3] != fmt:
+            raise ValueError(f'Mismatched audio format: {wav[:3]} != {fmt}')
+    data_size = sum(len(wav[3]) for wav in wavs)
+    return b''.join([__make_wav_header(*fmt, data_size), *(wav[3] for wav in wavs)])
 
 
 def split_text_by_max_bytes(text, max_bytes_len=settings.batch_max_bytes):
@@ -527,6 +2180,7 @@ def main():
     if settings.debug and not settings.play_command:
         # lazily importing soundcard because it is slow
         import soundcard as sc
+
         logger.debug('speakers: %s', sc.all_speakers())
 
     if args.script is sys.stdin:
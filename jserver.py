@@ -15,17 +15,21 @@
 # ///
 
 import argparse
+import asyncio
+import concurrent.futures
 import json
 import logging
 import os
 import socket
+import threading
+import weakref
 from pathlib import Path
 from typing import Any
 
 import paho.mqtt.client as mqtt
 import uvicorn
 from fastapi import FastAPI
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, BaseSettings
 
 import jsay
@@ -68,6 +72,10 @@ class Settings(BaseSettings):
     mqtt_topic_all: str = 'tts/jsay/all'
     mqtt_qos: int = 0
     serve_http: bool = False
+    synthesis_executor: str = 'thread'
+    synthesis_workers: int = 2
+    synthesis_max_pending: int = 16
+    synthesis_timeout: float | None = 60
     listen_port: int = 9000
     r: float = 1.0
     fm: float = 3.0
@@ -95,6 +103,14 @@ settings = Settings()
 logger_mqtt = logging.getLogger('mqtt')
 logger_http = logging.getLogger('http')
 logger_uvicorn = logging.getLogger('uvicorn')
+
+__executor: concurrent.futures.Executor | None = None
+__stream_executor: concurrent.futures.ThreadPoolExecutor | None = None
+# counts of reloads, forced reloads and cache clears requested so far and
+# applied in this process, process workers catch up before each synthesis
+__requested_epochs = [0, 0, 0]
+__applied_epochs = [0, 0, 0]
+__synthesis_slots = threading.BoundedSemaphore(settings.synthesis_max_pending)
 logging.getLogger('asyncio').setLevel(logging.WARNING)
 
 
@@ -163,6 +179,10 @@ class SayParam(BaseModel):
     english_to_kana: bool = settings.english_to_kana
     use_user_dic: bool = settings.use_user_dic
     shorten_urls: bool = settings.shorten_urls
+    output_sampling_rate: int | None = None
+    output_stereo: bool = False
+    stream: bool = False
+    response_format: str = 'wav'
 
 
 class OpenAISpeechParam(BaseModel):
@@ -176,11 +196,177 @@ class OpenAISpeechParam(BaseModel):
     english_to_kana: bool = settings.english_to_kana
     use_user_dic: bool = settings.use_user_dic
     shorten_urls: bool = settings.shorten_urls
+    output_sampling_rate: int | None = None
+    output_stereo: bool = False
+    stream: bool = False
+
+
+def __ensure_executor():
+    global __executor
+    if __executor is None:
+        if settings.synthesis_executor == 'process':
+            __executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=settings.synthesis_workers
+            )
+        else:
+            __executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=settings.synthesis_workers
+            )
+    return __executor
+
+
+def __ensure_stream_executor():
+    global __stream_executor
+    # generators cannot be iterated across processes, so streams get their
+    # own threads in process mode
+    if settings.synthesis_executor != 'process':
+        return __ensure_executor()
+    if __stream_executor is None:
+        __stream_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.synthesis_workers
+        )
+    return __stream_executor
+
+
+def __sync_worker(epochs, func, *args, **kwargs):
+    if epochs[0] > __applied_epochs[0]:
+        jsay.reload_dictionaries(epochs[1] > __applied_epochs[1])
+    if epochs[2] > __applied_epochs[2]:
+        jsay.clear_audio_cache()
+    __applied_epochs[:] = epochs
+    return func(*args, **kwargs)
+
+
+def __submit_synthesis(func, *args, **kwargs):
+    executor = __ensure_executor()
+    if settings.synthesis_executor == 'process':
+        return executor.submit(
+            __sync_worker, list(__requested_epochs), func, *args, **kwargs
+        )
+    return executor.submit(func, *args, **kwargs)
+
+
+async def __generate_audio_response(
+    *args, response_format='wav', output_sampling_rate=None, output_stereo=False
+):
+    if response_format not in jsay.AUDIO_MEDIA_TYPES or (
+        output_sampling_rate is not None and output_sampling_rate <= 0
+    ):
+        return Response('Bad Request', status_code=400)
+
+    if not __synthesis_slots.acquire(blocking=False):
+        logger_uvicorn.warning('too many pending requests')
+        return Response(
+            'Service Unavailable', status_code=503, headers={'Retry-After': '1'}
+        )
+
+    try:
+        future = __submit_synthesis(
+            jsay.generate_audio_bytes,
+            *args,
+            response_format=response_format,
+            output_sampling_rate=output_sampling_rate,
+            output_stereo=output_stereo,
+        )
+    except Exception:
+        __synthesis_slots.release()
+        raise
+    future.add_done_callback(lambda _: __synthesis_slots.release())
+
+    try:
+        audio_bytes = await asyncio.wait_for(
+            asyncio.wrap_future(future), settings.synthesis_timeout
+        )
+    except asyncio.TimeoutError:
+        logger_uvicorn.error('synthesis timed out')
+        return Response('Gateway Timeout', status_code=504)
+    except Exception as e:
+        logger_uvicorn.error(e)
+        audio_bytes = b''
+
+    return Response(
+        content=audio_bytes, media_type=jsay.AUDIO_MEDIA_TYPES[response_format]
+    )
+
+
+async def __stream_audio_response(
+    *args, response_format='wav', output_sampling_rate=None, output_stereo=False
+):
+    if response_format not in jsay.AUDIO_MEDIA_TYPES or (
+        output_sampling_rate is not None and output_sampling_rate <= 0
+    ):
+        return Response('Bad Request', status_code=400)
+
+    if not __synthesis_slots.acquire(blocking=False):
+        logger_uvicorn.warning('too many pending requests')
+        return Response(
+            'Service Unavailable', status_code=503, headers={'Retry-After': '1'}
+        )
+
+    executor = __ensure_stream_executor()
+    started = False
+
+    async def iterate():
+        nonlocal started
+        started = True
+        chunks = jsay.generate_audio_stream(
+            *args,
+            response_format=response_format,
+            output_sampling_rate=output_sampling_rate,
+            output_stereo=output_stereo,
+        )
+
+        def finish(_=None):
+            chunks.close()
+            __synthesis_slots.release()
+
+        future = None
+        try:
+            while True:
+                future = executor.submit(next, chunks, None)
+                chunk = await asyncio.wait_for(
+                    asyncio.wrap_future(future), settings.synthesis_timeout
+                )
+                if chunk is None:
+                    break
+                yield chunk
+        except asyncio.TimeoutError:
+            logger_uvicorn.error('synthesis timed out')
+        except Exception as e:
+            logger_uvicorn.error(e)
+        finally:
+            # the slot is held until the chunk being synthesized is finished
+            if future is not None and not future.done():
+                future.add_done_callback(finish)
+            else:
+                finish()
+
+    def release_unstarted():
+        if not started:
+            __synthesis_slots.release()
+
+    # the body is never iterated when the client disconnects or sending the
+    # response start fails, so the slot is also released with the iterator
+    body = iterate()
+    weakref.finalize(body, release_unstarted)
+    media_type = jsay.AUDIO_MEDIA_TYPES[response_format]
+    return StreamingResponse(body, media_type=media_type)
 
 
 app = FastAPI()
 
 
+def warm_up():
+    if settings.synthesis_executor == 'process':
+        # worker processes are forked before any other thread is started
+        executor = __ensure_executor()
+        futures = [
+            executor.submit(os.getpid) for _ in range(settings.synthesis_workers)
+        ]
+        for future in futures:
+            future.result()
+
+
 @app.get('/say')
 async def get_say(
     text: str,
@@ -240,11 +426,15 @@ async def get_audio(
     english_to_kana: bool = settings.english_to_kana,
     use_user_dic: bool = settings.use_user_dic,
     shorten_urls: bool = settings.shorten_urls,
+    stream: bool = False,
+    output_sampling_rate: int | None = None,
+    output_stereo: bool = False,
+    response_format: str = 'wav',
 ):
     logger_http.debug(locals())
     logger_uvicorn.info(text.replace('\n', '⏎'))
-    try:
-        audio_bytes = jsay.generate_audio_bytes(
+    if stream:
+        return await __stream_audio_response(
             text,
             r,
             fm,
@@ -252,20 +442,31 @@ async def get_audio(
             english_to_kana,
             use_user_dic,
             shorten_urls,
+            response_format=response_format,
+            output_sampling_rate=output_sampling_rate,
+            output_stereo=output_stereo,
         )
-    except Exception as e:
-        logger_uvicorn.error(e)
-        audio_bytes = b''
 
-    return Response(content=audio_bytes, media_type='audio/wav')
+    return await __generate_audio_response(
+        text,
+        r,
+        fm,
+        english_word_min_length,
+        english_to_kana,
+        use_user_dic,
+        shorten_urls,
+        response_format=response_format,
+        output_sampling_rate=output_sampling_rate,
+        output_stereo=output_stereo,
+    )
 
 
 @app.post('/audio')
 async def post_audio(param: SayParam):
     logger_http.debug(locals())
     logger_uvicorn.info(param.text)
-    try:
-        audio_bytes = jsay.generate_audio_bytes(
+    if param.stream:
+        return await __stream_audio_response(
             param.text,
             param.r,
             param.fm,
@@ -273,20 +474,31 @@ async def post_audio(param: SayParam):
             param.english_to_kana,
             param.use_user_dic,
             param.shorten_urls,
+            response_format=param.response_format,
+            output_sampling_rate=param.output_sampling_rate,
+            output_stereo=param.output_stereo,
         )
-    except Exception as e:
-        logger_uvicorn.error(e)
-        audio_bytes = b''
 
-    return Response(content=audio_bytes, media_type='audio/wav')
+    return await __generate_audio_response(
+        param.text,
+        param.r,
+        param.fm,
+        param.english_word_min_length,
+        param.english_to_kana,
+        param.use_user_dic,
+        param.shorten_urls,
+        response_format=param.response_format,
+        output_sampling_rate=param.output_sampling_rate,
+        output_stereo=param.output_stereo,
+    )
 
 
 @app.post('/v1/audio/speech')
 async def post_speech(param: OpenAISpeechParam):
     logger_http.debug(locals())
     logger_uvicorn.info(param.input)
-    try:
-        audio_bytes = jsay.generate_audio_bytes(
+    if param.stream:
+        return await __stream_audio_response(
             param.input,
             param.speed,
             param.fm,
@@ -294,12 +506,52 @@ async def post_speech(param: OpenAISpeechParam):
             param.english_to_kana,
             param.use_user_dic,
             param.shorten_urls,
+            response_format=param.response_format,
+            output_sampling_rate=param.output_sampling_rate,
+            output_stereo=param.output_stereo,
         )
-    except Exception as e:
-        logger_uvicorn.error(e)
-        audio_bytes = b''
 
-    return Response(content=audio_bytes, media_type='audio/wav')
+    return await __generate_audio_response(
+        param.input,
+        param.speed,
+        param.fm,
+        param.english_word_min_length,
+        param.english_to_kana,
+        param.use_user_dic,
+        param.shorten_urls,
+        response_format=param.response_format,
+        output_sampling_rate=param.output_sampling_rate,
+        output_stereo=param.output_stereo,
+    )
+
+
+@app.get('/stats')
+async def get_stats():
+    return {
+        'audio_cache': jsay.get_audio_cache_stats(),
+        'phrase_cache': jsay.get_phrase_cache_stats(),
+        'kana_cache': jsay.get_kana_cache_stats(),
+        'open_jtalk': jsay.get_open_jtalk_stats(),
+    }
+
+
+@app.delete('/cache')
+async def delete_cache():
+    jsay.clear_audio_cache()
+    __requested_epochs[2] += 1
+    __applied_epochs[2] = __requested_epochs[2]
+    return Response('OK')
+
+
+@app.post('/reload')
+async def post_reload(force: bool = False):
+    loop = asyncio.get_running_loop()
+    reloaded = await loop.run_in_executor(None, jsay.reload_dictionaries, force)
+    __requested_epochs[0] += 1
+    if force:
+        __requested_epochs[1] += 1
+    __applied_epochs[:] = __requested_epochs
+    return {'reloaded': reloaded, 'version': jsay.DIC_VERSION}
 
 
 def _parse_args():
@@ -338,6 +590,9 @@ def main():
     if not args.enable_mqtt and not args.serve_http:
         raise ValueError('At least one of --enable-mqtt or --serve-http is required.')
 
+    if args.serve_http:
+        warm_up()
+
     if args.enable_mqtt:
         topics = args.mqtt_topics
         if settings.mqtt_topic_all:
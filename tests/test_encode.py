@@ -0,0 +1,33 @@
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jsay import SoundfileEncoder  # noqa: E402
+
+FRAMERATE = 24000
+# lame delays the audio by 576 + 529 samples and pads the last 576 sample frame
+MP3_MAX_EXTRA_SAMPLES = 576 + 529 + 576
+
+
+@pytest.mark.parametrize('num_samples', [1000, FRAMERATE, FRAMERATE * 3 + 123])
+def test_streamed_mp3_decodes_to_all_samples(num_samples):
+    samples = (np.sin(np.arange(num_samples) / 10) * 10000).astype('<i2')
+    data = samples.tobytes()
+    split = len(data) // 4 * 2
+
+    encoder = SoundfileEncoder('mp3', 1, 2, FRAMERATE)
+    chunks = [encoder.encode(data[:split]), encoder.encode(data[split:])]
+    chunks.append(encoder.close())
+    audio_bytes = b''.join(chunks)
+
+    # the placeholder of the lame tag frame must not be streamed
+    assert audio_bytes[4:36].strip(b'\0') != b''
+    decoded, samplerate = sf.read(io.BytesIO(audio_bytes), dtype='int16')
+    assert samplerate == FRAMERATE
+    assert num_samples <= len(decoded) <= num_samples + MP3_MAX_EXTRA_SAMPLES